@@ -1,15 +1,11 @@
-from octis.evaluation_metrics.metrics import AbstractMetric
+from octis.evaluation_metrics.metrics import AbstractMetric, memoize_score
+from octis.evaluation_metrics.utils import KeyedVectorsMixin, pairwise_cosine
 from octis.dataset.dataset import Dataset
 from gensim.corpora.dictionary import Dictionary
 from gensim.models import CoherenceModel
-from gensim.models import KeyedVectors
-import gensim.downloader as api
 import octis.configuration.citations as citations
 import numpy as np
 import itertools
-from scipy import spatial
-from sklearn.metrics import pairwise_distances
-from operator import add
 
 
 class Coherence(AbstractMetric):
@@ -40,6 +36,7 @@ class Coherence(AbstractMetric):
             "name": "Coherence"
         }
 
+    @memoize_score
     def score(self, model_output):
         """
         Retrieve the score of the metric
@@ -64,7 +61,7 @@ class Coherence(AbstractMetric):
             return npmi.get_coherence()
 
 
-class WECoherencePairwise(AbstractMetric):
+class WECoherencePairwise(KeyedVectorsMixin, AbstractMetric):
     def __init__(self, word2vec_path=None, binary=False, topk=10):
         """
         Initialize metric
@@ -82,11 +79,7 @@ class WECoherencePairwise(AbstractMetric):
         self.binary = binary
         self.topk = topk
         self.word2vec_path = word2vec_path
-        if word2vec_path is None:
-            self._wv = api.load('word2vec-google-news-300')
-        else:
-            self._wv = KeyedVectors.load_word2vec_format(
-                word2vec_path, binary=self.binary)
+        self.load_keyedvectors(word2vec_path, binary=self.binary)
 
     def info(self):
         return {
@@ -94,6 +87,7 @@ class WECoherencePairwise(AbstractMetric):
             "name": "Coherence word embeddings pairwise cosine"
         }
 
+    @memoize_score
     def score(self, model_output):
         """
         Retrieve the score of the metric
@@ -112,21 +106,16 @@ class WECoherencePairwise(AbstractMetric):
 
         result = 0.0
         for topic in topics:
-            E = []
-
-            # Create matrix E (normalize word embeddings of
-            # words represented as vectors in wv)
-            for word in topic[0:self.topk]:
-                if word in self._wv.key_to_index.keys():
-                    word_embedding = self._wv.__getitem__(word)
-                    normalized_we = word_embedding / word_embedding.sum()
-                    E.append(normalized_we)
+            # matrix E: the topic's in-vocabulary embeddings gathered with a
+            # single contiguous fancy-indexing pass, rows normalized by sum
+            E = self.vecs_for(topic[0:self.topk], normed=False)
             if len(E) > 0:
-                E = np.array(E)
+                E = E / E.sum(axis=1, keepdims=True)
 
                 # Perform cosine similarity between E rows
-                distances = np.sum(1 - pairwise_distances(E, metric='cosine') - np.diag(np.ones(len(E))))
-                topic_coherence = distances/(self.topk*(self.topk-1))
+                sims = pairwise_cosine(E)
+                np.fill_diagonal(sims, 0)
+                topic_coherence = np.sum(sims)/(self.topk*(self.topk-1))
             else:
                 topic_coherence = -1
 
@@ -136,7 +125,7 @@ class WECoherencePairwise(AbstractMetric):
         return result
 
 
-class WECoherenceCentroid(AbstractMetric):
+class WECoherenceCentroid(KeyedVectorsMixin, AbstractMetric):
     def __init__(self, topk=10, word2vec_path=None, binary=True):
         """
         Initialize metric
@@ -151,11 +140,7 @@ class WECoherenceCentroid(AbstractMetric):
         self.topk = topk
         self.binary = binary
         self.word2vec_path = word2vec_path
-        if self.word2vec_path is None:
-            self._wv = api.load('word2vec-google-news-300')
-        else:
-            self._wv = KeyedVectors.load_word2vec_format(
-                self.word2vec_path, binary=self.binary)
+        self.load_keyedvectors(self.word2vec_path, binary=self.binary)
 
     @staticmethod
     def info():
@@ -164,6 +149,7 @@ class WECoherenceCentroid(AbstractMetric):
             "name": "Coherence word embeddings centroid"
         }
 
+    @memoize_score
     def score(self, model_output):
         """
         Retrieve the score of the metric
@@ -178,31 +164,19 @@ class WECoherenceCentroid(AbstractMetric):
         else:
             result = 0
             for topic in topics:
-                E = []
-                # average vector of the words in topic (centroid)
-                t = np.zeros(self._wv.vector_size)
-                # Create matrix E (normalize word embeddings of
-                # words represented as vectors in wv) and
-                # average vector of the words in topic
-                for word in topic[0:self.topk]:
-                    if word in self._wv.key_to_index.keys():
-                        word_embedding = self._wv.__getitem__(word)
-                        normalized_we = word_embedding/sum(word_embedding)
-                        E.append(normalized_we)
-                        t = list(map(add, t, word_embedding))
-
-                t = np.array(t)
-                if sum(t) != 0:
-                    t = t/(len(t)*sum(t))
+                # matrix E: the topic's in-vocabulary embeddings gathered with
+                # a single contiguous fancy-indexing pass; their sum is the
+                # centroid before normalization
+                E = self.vecs_for(topic[0:self.topk], normed=False)
 
                 if len(E) > 0:
-                    topic_coherence = 0
-                    # Perform cosine similarity between each word embedding in E
-                    # and t.
-                    for word_embedding in E:
-                        distance = spatial.distance.cosine(word_embedding, t)
-                        topic_coherence += distance
-                    topic_coherence = topic_coherence/self.topk
+                    t = E.sum(axis=0)
+                    if t.sum() != 0:
+                        t = t/(len(t)*t.sum())
+                    E = E / E.sum(axis=1, keepdims=True)
+                    # cosine distance between every row of E and t in one shot
+                    sims = np.einsum('ij,j->i', E, t) / (np.linalg.norm(E, axis=1) * np.linalg.norm(t))
+                    topic_coherence = np.sum(1 - sims) / self.topk
                 else:
                     topic_coherence = -1
 
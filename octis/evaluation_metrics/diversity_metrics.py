@@ -1,12 +1,16 @@
-from octis.evaluation_metrics.metrics import AbstractMetric
+from octis.evaluation_metrics.metrics import AbstractMetric, memoize_score
 import octis.configuration.citations as citations
 import itertools
 import numpy as np
 from octis.evaluation_metrics.rbo import rbo
 from octis.evaluation_metrics.word_embeddings_rbo import word_embeddings_rbo
 from octis.evaluation_metrics.word_embeddings_rbo_centroid import word_embeddings_rbo as weirbo_centroid
-import gensim.downloader as api
-from gensim.models import KeyedVectors
+from octis.evaluation_metrics.utils import KeyedVectorsMixin
+
+try:
+    from joblib import Parallel, delayed, effective_n_jobs
+except ImportError:
+    Parallel = None
 
 
 class TopicDiversity(AbstractMetric):
@@ -54,44 +58,54 @@ class TopicDiversity(AbstractMetric):
 
 
 class InvertedRBO(AbstractMetric):
-    def __init__(self, topk=10, weight=0.9):
+    def __init__(self, topk=10, weight=0.9, n_jobs=1):
         """
         Initialize metric Inverted Ranked-Biased Overlap
 
         :param topk: top k words on which the topic diversity will be computed
         :param weight: weight of each agreement at depth d. When set to 1.0, there is no weight, the rbo returns to
         average overlap. (default 0.9)
+        :param n_jobs: number of processes used to evaluate the topic pairs, 1 disables parallelism (default 1)
         """
         super().__init__()
         self.topk = topk
         self.weight = weight
+        self.n_jobs = n_jobs
 
+    @memoize_score
     def score(self, model_output):
         """
         Retrieves the score of the metric
 
         :param model_output : dictionary, output of the model. the 'topics' key is required.
 
+        """
+        average = self._average_rbo(model_output)
+        if average is None:
+            return 0
+        return 1 - average
+
+    def _average_rbo(self, model_output):
+        """
+        Average RBO over all topic pairs, or None if there are no topics:
+        subclasses folding the inversion back (1 - (1 - x)) call this
+        directly instead of inverting twice
         """
         topics = model_output['topics']
         if topics is None:
-            return 0
+            return None
         if self.topk > len(topics[0]):
             raise Exception('Words in topics are less than topk')
         else:
-            collect = []
-            for list1, list2 in itertools.combinations(topics, 2):
-                word2index = get_word2index(list1, list2)
-                indexed_list1 = [word2index[word] for word in list1]
-                indexed_list2 = [word2index[word] for word in list2]
-                rbo_val = rbo(indexed_list1[:self.topk], indexed_list2[:self.topk], p=self.weight)[2]
-                collect.append(rbo_val)
-            return 1 - np.mean(collect)
+            truncated = [topic[:self.topk] for topic in topics]
+            pairs = list(itertools.combinations(truncated, 2))
+            collect = _collect_pairs(_rbo_for_pairs, pairs, self.n_jobs, self.weight)
+            return np.mean(collect)
 
 
-class WordEmbeddingsInvertedRBO(AbstractMetric):
+class WordEmbeddingsInvertedRBO(KeyedVectorsMixin, AbstractMetric):
 
-    def __init__(self, topk=10, weight=0.9, normalize=True, word2vec_path=None, binary=True):
+    def __init__(self, topk=10, weight=0.9, normalize=True, word2vec_path=None, binary=True, n_jobs=1):
         """
         Initialize metric WE-IRBO-Match
 
@@ -102,6 +116,7 @@ class WordEmbeddingsInvertedRBO(AbstractMetric):
         :param weight: Weight of each agreement at depth d. When set to 1.0, there is no weight, the rbo returns to
         average overlap. (Default 0.9)
         :param normalize: if true, normalize the cosine similarity
+        :param n_jobs: number of processes used to evaluate the topic pairs, 1 disables parallelism (default 1)
         """
         super().__init__()
         self.topk = topk
@@ -109,32 +124,35 @@ class WordEmbeddingsInvertedRBO(AbstractMetric):
         self.norm = normalize
         self.binary = binary
         self.word2vec_path = word2vec_path
-        if word2vec_path is None:
-            self._wv = api.load('word2vec-google-news-300')
-        else:
-            self._wv = KeyedVectors.load_word2vec_format(word2vec_path, binary=self.binary)
+        self.n_jobs = n_jobs
+        self.load_keyedvectors(word2vec_path, binary=self.binary)
 
+    @memoize_score
     def score(self, model_output):
         """
         :return: rank_biased_overlap over the topics
         """
+        average = self._average_rbo(model_output)
+        if average is None:
+            return 0
+        return 1 - average
+
+    def _average_rbo(self, model_output):
+        """
+        Average word-embeddings RBO over all topic pairs, or None if there
+        are no topics
+        """
         topics = model_output['topics']
         if topics is None:
-            return 0
+            return None
         if self.topk > len(topics[0]):
             raise Exception('Words in topics are less than topk')
         else:
-            collect = []
-            for list1, list2 in itertools.combinations(topics, 2):
-                word2index = get_word2index(list1, list2)
-                index2word = {v: k for k, v in word2index.items()}
-                indexed_list1 = [word2index[word] for word in list1]
-                indexed_list2 = [word2index[word] for word in list2]
-                rbo_val = word_embeddings_rbo(
-                    indexed_list1[:self.topk], indexed_list2[:self.topk], p=self.weight,
-                    index2word=index2word, word2vec=self._wv, norm=self.norm)[2]
-                collect.append(rbo_val)
-            return 1 - np.mean(collect)
+            truncated = [topic[:self.topk] for topic in topics]
+            pairs = list(itertools.combinations(truncated, 2))
+            collect = _collect_pairs(
+                _we_rbo_for_pairs, pairs, self.n_jobs, self.weight, self.wv, self.norm)
+            return np.mean(collect)
 
 
 def get_word2index(list1, list2):
@@ -144,41 +162,94 @@ def get_word2index(list1, list2):
     return word2index
 
 
-class WordEmbeddingsInvertedRBOCentroid(AbstractMetric):
-    def __init__(self, topk=10, weight=0.9, normalize=True, word2vec_path=None, binary=True):
+def _collect_pairs(pairs_function, pairs, n_jobs, *args):
+    """
+    Evaluate pairs_function over the topic pairs, striping the pairs into one
+    chunk per process when n_jobs enables parallelism (so the embedding space
+    is shipped to each worker once per chunk, not once per pair)
+    """
+    if n_jobs == 1 or Parallel is None:
+        return pairs_function(pairs, *args)
+    jobs = effective_n_jobs(n_jobs)
+    chunks = [pairs[start::jobs] for start in range(jobs)]
+    collected = Parallel(n_jobs=jobs)(
+        delayed(pairs_function)(chunk, *args) for chunk in chunks)
+    return [value for chunk_values in collected for value in chunk_values]
+
+
+def _rbo_for_pairs(pairs, weight):
+    values = []
+    for list1, list2 in pairs:
+        word2index = get_word2index(list1, list2)
+        indexed_list1 = [word2index[word] for word in list1]
+        indexed_list2 = [word2index[word] for word in list2]
+        values.append(rbo(indexed_list1, indexed_list2, p=weight)[2])
+    return values
+
+
+def _we_rbo_for_pairs(pairs, weight, word2vec, norm):
+    values = []
+    for list1, list2 in pairs:
+        word2index = get_word2index(list1, list2)
+        index2word = {v: k for k, v in word2index.items()}
+        indexed_list1 = [word2index[word] for word in list1]
+        indexed_list2 = [word2index[word] for word in list2]
+        values.append(word_embeddings_rbo(
+            indexed_list1, indexed_list2, p=weight,
+            index2word=index2word, word2vec=word2vec, norm=norm)[2])
+    return values
+
+
+def _weirbo_centroid_for_pairs(pairs, weight, embedding_space, norm):
+    values = []
+    for list1, list2 in pairs:
+        word2index = get_word2index(list1, list2)
+        index2word = {v: k for k, v in word2index.items()}
+        indexed_list1 = [word2index[word] for word in list1]
+        indexed_list2 = [word2index[word] for word in list2]
+        values.append(weirbo_centroid(
+            indexed_list1, indexed_list2, p=weight, index2word=index2word,
+            embedding_space=embedding_space, norm=norm)[2])
+    return values
+
+
+class WordEmbeddingsInvertedRBOCentroid(KeyedVectorsMixin, AbstractMetric):
+    def __init__(self, topk=10, weight=0.9, normalize=True, word2vec_path=None, binary=True, n_jobs=1):
         super().__init__()
         self.topk = topk
         self.weight = weight
         self.norm = normalize
         self.binary = binary
         self.word2vec_path = word2vec_path
-        if word2vec_path is None:
-            self.wv = api.load('word2vec-google-news-300')
-        else:
-            self.wv = KeyedVectors.load_word2vec_format( word2vec_path, binary=self.binary)
+        self.n_jobs = n_jobs
+        self.load_keyedvectors(word2vec_path, binary=self.binary)
 
+    @memoize_score
     def score(self, model_output):
         """
         :return: rank_biased_overlap over the topics
         """
+        average = self._average_rbo(model_output)
+        if average is None:
+            return 0
+        return 1 - average
+
+    def _average_rbo(self, model_output):
+        """
+        Average centroid word-embeddings RBO over all topic pairs, or None
+        if there are no topics
+        """
         topics = model_output['topics']
         if topics is None:
-            return 0
+            return None
         if self.topk > len(topics[0]):
             raise Exception('Words in topics are less than topk')
         else:
-            collect = []
-            for list1, list2 in itertools.combinations(topics, 2):
-                word2index = get_word2index(list1, list2)
-                index2word = {v: k for k, v in word2index.items()}
-                indexed_list1 = [word2index[word] for word in list1]
-                indexed_list2 = [word2index[word] for word in list2]
-                rbo_val = weirbo_centroid(
-                    indexed_list1[:self.topk], indexed_list2[:self.topk], p=self.weight, index2word=index2word,
-                    embedding_space=self.wv, norm=self.norm)[2]
-
-                collect.append(rbo_val)
-            return 1 - np.mean(collect)
+            truncated = [topic[:self.topk] for topic in topics]
+            pairs = list(itertools.combinations(truncated, 2))
+            collect = _collect_pairs(
+                _weirbo_centroid_for_pairs, pairs, self.n_jobs, self.weight, self.wv, self.norm)
+            return np.mean(collect)
 
 
 class LogOddsRatio(AbstractMetric):
@@ -188,8 +259,9 @@ class LogOddsRatio(AbstractMetric):
         """
         super().__init__()
 
+    @memoize_score
     def score(self, model_output):
-        beta = model_output['topic-word-matrix']
+        beta = np.array(model_output['topic-word-matrix'])
         lor = 0
         count = 0
         for i, j in itertools.combinations(range(len(beta)), 2):
@@ -199,11 +271,8 @@ class LogOddsRatio(AbstractMetric):
 
 
 def _LOR(P, Q):
-    lor = 0
-    for v, w in zip(P, Q):
-        if v > 0 or w > 0:
-            lor = lor + np.abs(np.log(v) - np.log(w))
-    return lor / len(P)
+    mask = (P > 0) | (Q > 0)
+    return np.sum(np.abs(np.log(P[mask]) - np.log(Q[mask]))) / len(P)
 
 
 class KLDivergence(AbstractMetric):
@@ -213,33 +282,16 @@ class KLDivergence(AbstractMetric):
         """
         super().__init__()
 
+    @memoize_score
     def score(self, model_output):
-        beta = model_output['topic-word-matrix']
-        kl_div = 0
-        count = 0
-        for i, j in itertools.combinations(range(len(beta)), 2):
-            kl_div += _KL(beta[i], beta[j])
-            count += 1
-        return kl_div / count
-
-
-def _KL(P, Q):
-    """
-    Perform Kullback-Leibler divergence
-
-    Parameters
-    ----------
-    P : distribution P
-    Q : distribution Q
-
-    Returns
-    -------
-    divergence : divergence from Q to P
-    """
-    # add epsilon to grant absolute continuity
-    epsilon = 0.00001
-    P = P+epsilon
-    Q = Q+epsilon
-
-    divergence = np.sum(P*np.log(P/Q))
-    return divergence
+        beta = np.array(model_output['topic-word-matrix'])
+        # add epsilon to grant absolute continuity
+        epsilon = 0.00001
+        beta = beta + epsilon
+        # KL(i, j) = sum(P_i log P_i) - sum(P_i log P_j): all pairwise
+        # divergences come from one matrix product, then a single
+        # upper-triangle pass covers the same (i, j) pairs as before
+        log_beta = np.log(beta)
+        self_entropy = np.sum(beta * log_beta, axis=1)
+        kl_matrix = self_entropy[:, np.newaxis] - np.dot(beta, log_beta.T)
+        return kl_matrix[np.triu_indices(len(beta), k=1)].mean()
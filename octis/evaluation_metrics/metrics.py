@@ -1,4 +1,23 @@
 from abc import ABC, abstractmethod
+from functools import wraps
+
+
+def memoize_score(score_method):
+    """
+    Cache the last score of a metric instance, keyed by the identity of
+    model_output: scoring the same output twice (e.g. once as optimization
+    metric and once as extra metric) returns the cached value instead of
+    recomputing it
+    """
+    @wraps(score_method)
+    def scored(self, model_output):
+        if getattr(self, '_last_output', None) is model_output:
+            return self._last_score
+        score = score_method(self, model_output)
+        self._last_output = model_output
+        self._last_score = score
+        return score
+    return scored
 
 
 class AbstractMetric(ABC):
@@ -1,15 +1,13 @@
 from octis.evaluation_metrics.diversity_metrics import WordEmbeddingsInvertedRBO, \
     WordEmbeddingsInvertedRBOCentroid, InvertedRBO
 import numpy as np
-from itertools import combinations
-from scipy.spatial.distance import cosine
-from octis.evaluation_metrics.metrics import AbstractMetric
-from gensim.models import KeyedVectors
-import gensim.downloader as api
+from scipy.sparse import csr_matrix, issparse
+from octis.evaluation_metrics.metrics import AbstractMetric, memoize_score
+from octis.evaluation_metrics.utils import KeyedVectorsMixin, maybe_njit, njit, pairwise_cosine
 
 
 class WordEmbeddingsRBOMatch(WordEmbeddingsInvertedRBO):
-    def __init__(self, word2vec_path=None, binary=True, normalize=True, weight=0.9, topk=10):
+    def __init__(self, word2vec_path=None, binary=True, normalize=True, weight=0.9, topk=10, n_jobs=1):
         """
         Initialize metric WERBO-Match
 
@@ -21,20 +19,28 @@ class WordEmbeddingsRBOMatch(WordEmbeddingsInvertedRBO):
         average overlap. (Default 0.9)
         :param binary: If True, indicates whether the data is in binary word2vec format.
         :param normalize: if true, normalize the cosine similarity
+        :param n_jobs: number of processes used to evaluate the topic pairs, 1 disables parallelism (default 1)
         """
-        super().__init__(word2vec_path=word2vec_path, binary=binary, normalize=normalize, weight=weight, topk=topk)
+        super().__init__(word2vec_path=word2vec_path, binary=binary, normalize=normalize, weight=weight, topk=topk,
+                         n_jobs=n_jobs)
 
+    @memoize_score
     def score(self, model_output):
         """
         Retrieves the score of the metric
 
         :return WERBO-M
         """
-        return 1 - super(WordEmbeddingsRBOMatch, self).score(model_output)
+        # folded: the parent already computes the average, inverting it twice
+        # (1 - (1 - x)) would just add an extra pass
+        average = self._average_rbo(model_output)
+        if average is None:
+            return 1
+        return average
 
 
 class WordEmbeddingsRBOCentroid(WordEmbeddingsInvertedRBOCentroid):
-    def __init__(self, word2vec_path=None, binary=True, normalize=True, weight=0.9, topk=10):
+    def __init__(self, word2vec_path=None, binary=True, normalize=True, weight=0.9, topk=10, n_jobs=1):
         """
         Initialize metric WERBO-Centroid
 
@@ -46,19 +52,27 @@ class WordEmbeddingsRBOCentroid(WordEmbeddingsInvertedRBOCentroid):
         average overlap. (Default 0.9)
         :param binary: If True, indicates whether the data is in binary word2vec format.
         :param normalize: if true, normalize the cosine similarity
+        :param n_jobs: number of processes used to evaluate the topic pairs, 1 disables parallelism (default 1)
         """
-        super().__init__(word2vec_path=word2vec_path, binary=binary, normalize=normalize, weight=weight, topk=topk)
+        super().__init__(word2vec_path=word2vec_path, binary=binary, normalize=normalize, weight=weight, topk=topk,
+                         n_jobs=n_jobs)
 
+    @memoize_score
     def score(self, model_output):
         """
         Retrieves the score of the metric
 
         :return WERBO-C
         """
-        return 1 - super(WordEmbeddingsRBOCentroid, self).score(model_output)
+        # folded: the parent already computes the average, inverting it twice
+        # (1 - (1 - x)) would just add an extra pass
+        average = self._average_rbo(model_output)
+        if average is None:
+            return 1
+        return average
 
 
-class WordEmbeddingsPairwiseSimilarity(AbstractMetric):
+class WordEmbeddingsPairwiseSimilarity(KeyedVectorsMixin, AbstractMetric):
     def __init__(self, word2vec_path=None, topk=10, binary=False):
         """
         Initialize metric WE pairwise similarity
@@ -70,13 +84,10 @@ class WordEmbeddingsPairwiseSimilarity(AbstractMetric):
         :param binary: If True, indicates whether the data is in binary word2vec format.
         """
         super().__init__()
-        if word2vec_path is None:
-            self.wv = api.load('word2vec-google-news-300')
-        else:
-            self.wv = KeyedVectors.load_word2vec_format( word2vec_path, binary=binary)
-
+        self.load_keyedvectors(word2vec_path, binary=binary)
         self.topk = topk
 
+    @memoize_score
     def score(self, model_output):
         """
         Retrieves the score of the metric
@@ -87,23 +98,24 @@ class WordEmbeddingsPairwiseSimilarity(AbstractMetric):
         if self.topk > len(topics[0]):
             raise Exception('Words in topics are less than topk')
         else:
-            count = 0
-            sum_sim = 0
-            for list1, list2 in combinations(topics, 2):
-                word_counts = 0
-                sim = 0
-                for word1 in list1[:self.topk]:
-                    for word2 in list2[:self.topk]:
-                        if word1 in self.wv.key_to_index.keys() and word2 in self.wv.key_to_index.keys():
-                            sim = sim + self.wv.similarity(word1, word2)
-                            word_counts = word_counts + 1
-                sim = sim / word_counts
-                sum_sim = sum_sim + sim
-                count = count + 1
-            return sum_sim / count
-
-
-class WordEmbeddingsCentroidSimilarity(AbstractMetric):
+            # sum of the normalized vectors of the in-vocabulary words of each topic:
+            # the sum of the pairwise cosine similarities between two topics is the
+            # dot product of their summed vectors, so a single matrix product
+            # replaces the per-word-pair similarity lookups
+            sum_vectors = np.zeros((len(topics), self.wv.vector_size), dtype=np.float32)
+            word_counts = np.zeros(len(topics))
+            for i, topic in enumerate(topics):
+                vectors = self.vecs_for(topic[:self.topk])
+                sum_vectors[i] = vectors.sum(axis=0)
+                word_counts[i] = len(vectors)
+            sims = np.dot(sum_vectors, sum_vectors.T)
+
+            # the matrix is symmetric, one upper-triangle pass covers all pairs
+            rows, cols = np.triu_indices(len(topics), k=1)
+            return (sims[rows, cols] / (word_counts[rows] * word_counts[cols])).mean()
+
+
+class WordEmbeddingsCentroidSimilarity(KeyedVectorsMixin, AbstractMetric):
     def __init__(self, word2vec_path=None, topk=10, binary=False):
         """
         Initialize metric WE centroid similarity
@@ -116,12 +128,10 @@ class WordEmbeddingsCentroidSimilarity(AbstractMetric):
 
         """
         super().__init__()
-        if word2vec_path is None:
-            self.wv = api.load('word2vec-google-news-300')
-        else:
-            self.wv = KeyedVectors.load_word2vec_format(word2vec_path, binary=binary)
+        self.load_keyedvectors(word2vec_path, binary=binary)
         self.topk = topk
 
+    @memoize_score
     def score(self, model_output):
         """
         Retrieves the score of the metric
@@ -132,25 +142,14 @@ class WordEmbeddingsCentroidSimilarity(AbstractMetric):
         if self.topk > len(topics[0]):
             raise Exception('Words in topics are less than topk')
         else:
-            sim = 0
-            count = 0
-            for list1, list2 in combinations(topics, 2):
-                centroid1 = np.zeros(self.wv.vector_size)
-                centroid2 = np.zeros(self.wv.vector_size)
-                count1, count2 = 0, 0
-                for word1 in list1[:self.topk]:
-                    if word1 in self.wv.key_to_index.keys():
-                        centroid1 = centroid1 + self.wv[word1]
-                        count1 += 1
-                for word2 in list2[:self.topk]:
-                    if word2 in self.wv.key_to_index.keys():
-                        centroid2 = centroid2 + self.wv[word2]
-                        count2 += 1
-                centroid1 = centroid1 / count1
-                centroid2 = centroid2 / count2
-                sim = sim + (1 - cosine(centroid1, centroid2))
-                count += 1
-            return sim / count
+            # compute each topic centroid once instead of once per pair, then
+            # get all pairwise cosine similarities with a single matrix product
+            # of the row-normalized centroid matrix
+            centroids = np.zeros((len(topics), self.wv.vector_size), dtype=np.float32)
+            for i, topic in enumerate(topics):
+                centroids[i] = self.vecs_for(topic[:self.topk], normed=False).mean(axis=0)
+            sims = pairwise_cosine(centroids)
+            return sims[np.triu_indices(len(topics), k=1)].mean()
 
 
 def get_word2index(list1, list2):
@@ -160,7 +159,7 @@ def get_word2index(list1, list2):
     return word2index
 
 
-class WordEmbeddingsWeightedSumSimilarity(AbstractMetric):
+class WordEmbeddingsWeightedSumSimilarity(KeyedVectorsMixin, AbstractMetric):
     def __init__(self, id2word, word2vec_path=None, topk=10, binary=False):
         """
         Initialize metric WE Weighted Sum similarity
@@ -172,13 +171,13 @@ class WordEmbeddingsWeightedSumSimilarity(AbstractMetric):
 
         """
         super().__init__()
-        if word2vec_path is None:
-            self.wv = api.load('word2vec-google-news-300')
-        else:
-            self.wv = KeyedVectors.load_word2vec_format(word2vec_path, binary=binary)
+        self.load_keyedvectors(word2vec_path, binary=binary)
         self.topk = topk
         self.id2word = id2word
+        # vocabulary embeddings stacked once, row i is the vector of id2word[i]
+        self._embeddings = self.wv.vectors[[self._key_to_index[id2word[i]] for i in range(len(id2word))]]
 
+    @memoize_score
     def score(self, model_output):
         """
         Retrieves the score of the metric
@@ -187,27 +186,25 @@ class WordEmbeddingsWeightedSumSimilarity(AbstractMetric):
         """
         beta = model_output['topic-word-distribution']
 
-        wess = 0
-        count = 0
-        for i, j in combinations(range(len(beta)), 2):
-            centroid1 = np.zeros(self.wv.vector_size)
-            weights = 0
-            for id_beta, w in enumerate(beta[i]):
-                centroid1 = centroid1 + self.wv[self.id2word[id_beta]] * w
-                weights += w
-            centroid1 = centroid1 / weights
-            centroid2 = np.zeros(self.wv.vector_size)
-            weights = 0
-            for id_beta, w in enumerate(beta[i]):
-                centroid2 = centroid2 + self.wv[self.id2word[id_beta]] * w
-                weights += w
-            centroid2 = centroid2 / weights
-            wess += cosine(centroid1, centroid2)
-        return wess / count
+        # weighted centroid of each topic in a single matrix product, then all
+        # pairwise cosine similarities at once from the normalized centroids
+        if issparse(beta):
+            # keep a sparse beta sparse: normalize its rows and project onto
+            # the embedding matrix without densifying the distribution
+            beta = beta.tocsr()
+            row_sums = np.asarray(beta.sum(axis=1), dtype=np.float32).ravel()
+            weights = beta.multiply((1.0 / row_sums)[:, np.newaxis]).tocsr()
+            centroids = weights.dot(self._embeddings)
+        else:
+            beta = np.asarray(beta, dtype=np.float32)
+            weights = beta / beta.sum(axis=1, keepdims=True)
+            centroids = np.dot(weights, self._embeddings)
+        sims = pairwise_cosine(centroids)
+        return sims[np.triu_indices(centroids.shape[0], k=1)].mean()
 
 
 class RBO(InvertedRBO):
-    def __init__(self, weight=0.9, topk=10):
+    def __init__(self, weight=0.9, topk=10, n_jobs=1):
         """
         Initialize metric Ranked-biased Overlap
 
@@ -216,16 +213,23 @@ class RBO(InvertedRBO):
         :param topk: top k words on which the topic diversity will be computed
         :param weight: Weight of each agreement at depth d. When set to 1.0, there is no weight, the rbo returns to
         average overlap. (Default 0.9)
+        :param n_jobs: number of processes used to evaluate the topic pairs, 1 disables parallelism (default 1)
         """
-        super().__init__(weight=weight, topk=topk)
+        super().__init__(weight=weight, topk=topk, n_jobs=n_jobs)
 
+    @memoize_score
     def score(self, model_output):
         """
         Retrieves the score of the metric
 
         :return RBO
         """
-        return 1 - super(RBO, self).score(model_output)
+        # folded: the parent already computes the average, inverting it twice
+        # (1 - (1 - x)) would just add an extra pass
+        average = self._average_rbo(model_output)
+        if average is None:
+            return 1
+        return average
 
 
 class PairwiseJaccardSimilarity(AbstractMetric):
@@ -241,6 +245,7 @@ class PairwiseJaccardSimilarity(AbstractMetric):
         super().__init__()
         self.topk = topk
 
+    @memoize_score
     def score(self, model_output):
         """
         Retrieves the score of the metric
@@ -248,12 +253,49 @@ class PairwiseJaccardSimilarity(AbstractMetric):
         :return PJS
         """
         topics = model_output['topics']
-        sim = 0
-        count = 0
-        for list1, list2 in combinations(topics, 2):
-            intersection = len(list(set(list1[:self.topk]).intersection(list2[:self.topk])))
-            union = (len(list1[:self.topk]) + len(list2[:self.topk])) - intersection
-            count = count + 1
-            sim = sim + (float(intersection) / union)
-        return sim / count
+        truncated = [topic[:self.topk] for topic in topics]
+        word2index = {word: index for index, word in
+                      enumerate({word for topic in truncated for word in topic})}
+        lengths = np.array([len(topic) for topic in truncated])
+
+        if njit is not None:
+            # pack the words of each topic into a bitset (one bit per word of
+            # the joint vocabulary) and run the whole pair loop of AND-plus-
+            # popcount intersections in compiled code
+            bitsets = np.zeros((len(topics), (len(word2index) + 7) // 8), dtype=np.uint8)
+            for i, topic in enumerate(truncated):
+                for word in topic:
+                    index = word2index[word]
+                    bitsets[i, index >> 3] |= 1 << (index & 7)
+            sim = _jaccard_pairwise_sum(bitsets, lengths, _POPCOUNT)
+            return sim / (len(topics) * (len(topics) - 1) // 2)
+
+        # CountVectorizer-style sparse topic-word incidence matrix: a single
+        # sparse product yields every pairwise intersection size at once
+        indices = np.array([word2index[word] for topic in truncated for word in topic])
+        indptr = np.concatenate(([0], np.cumsum(lengths)))
+        incidence = csr_matrix((np.ones(len(indices), dtype=np.int64), indices, indptr),
+                               shape=(len(topics), len(word2index)))
+        intersections = np.dot(incidence, incidence.T).toarray()
+
+        rows, cols = np.triu_indices(len(topics), k=1)
+        unions = lengths[rows] + lengths[cols] - intersections[rows, cols]
+        return (intersections[rows, cols] / unions).mean()
+
+
+# number of set bits of every possible byte, used to popcount packed bitsets
+_POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+
+@maybe_njit
+def _jaccard_pairwise_sum(bitsets, lengths, popcount):
+    sim = 0.0
+    for i in range(bitsets.shape[0]):
+        for j in range(i + 1, bitsets.shape[0]):
+            intersection = 0
+            for k in range(bitsets.shape[1]):
+                intersection += popcount[bitsets[i, k] & bitsets[j, k]]
+            union = lengths[i] + lengths[j] - intersection
+            sim += intersection / union
+    return sim
 
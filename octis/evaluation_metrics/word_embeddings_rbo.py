@@ -5,6 +5,8 @@ from bisect import bisect_left
 from collections import namedtuple
 from collections import OrderedDict
 
+from octis.evaluation_metrics.utils import weighted_geometric_series
+
 RBO = namedtuple("RBO", "min res ext")
 RBO.__doc__ += ": Result of full RBO analysis"
 RBO.min.__doc__ = "Lower bound estimate"
@@ -131,9 +133,9 @@ def rbo_res(list1, list2, p, index2word, word2vec, norm):
     # must be an integer --> math.ceil()
     f = int(math.ceil(l + s - x_l))
     # upper bound of range() is non-inclusive, therefore + 1 is needed
-    term1 = s * sum(p ** d / d for d in range(s + 1, f + 1))
-    term2 = l * sum(p ** d / d for d in range(l + 1, f + 1))
-    term3 = x_l * (math.log(1 / (1 - p)) - sum(p ** d / d for d in range(1, f + 1)))
+    term1 = s * weighted_geometric_series(p, s + 1, f)
+    term2 = l * weighted_geometric_series(p, l + 1, f)
+    term3 = x_l * (math.log(1 / (1 - p)) - weighted_geometric_series(p, 1, f))
     return p ** s + p ** l - p ** f - (1 - p) / p * (term1 + term2 + term3)
 
 
@@ -3,9 +3,10 @@ from __future__ import division
 from bisect import bisect_left
 from collections import namedtuple
 import numpy as np
-from scipy.spatial import distance
 import math
 
+from octis.evaluation_metrics.utils import cosine_similarity, weighted_geometric_series
+
 
 RBO = namedtuple("RBO", "min res ext")
 RBO.__doc__ += ": Result of full RBO analysis"
@@ -42,7 +43,7 @@ def embeddings_overlap(list1, list2, depth, index2word, embedding_space, norm=Tr
 
     centroid_1 = np.mean([embedding_space[w] for w in word_list1[:depth] if w in embedding_space], axis=0)
     centroid_2 = np.mean([embedding_space[w] for w in word_list2[:depth] if w in embedding_space], axis=0)
-    cos_sim = 1 - distance.cosine(centroid_1, centroid_2)
+    cos_sim = cosine_similarity(centroid_1, centroid_2)
     if cos_sim > 1:
         cos_sim = 1
     elif cos_sim < -1:
@@ -100,9 +101,9 @@ def rbo_res(list1, list2, p, index2word, embedding_space, norm=True):
     # must be an integer --> math.ceil()
     f = int(math.ceil(l + s - x_l))
     # upper bound of range() is non-inclusive, therefore + 1 is needed
-    term1 = s * sum(p ** d / d for d in range(s + 1, f + 1))
-    term2 = l * sum(p ** d / d for d in range(l + 1, f + 1))
-    term3 = x_l * (math.log(1 / (1 - p)) - sum(p ** d / d for d in range(1, f + 1)))
+    term1 = s * weighted_geometric_series(p, s + 1, f)
+    term2 = l * weighted_geometric_series(p, l + 1, f)
+    term3 = x_l * (math.log(1 / (1 - p)) - weighted_geometric_series(p, 1, f))
     return p ** s + p ** l - p ** f - (1 - p) / p * (term1 + term2 + term3)
 
 
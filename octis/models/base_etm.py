@@ -104,12 +104,14 @@ class BaseETM(AbstractModel):
 
         vectors = {}
         embs = pkl.load(open(embeddings_path, 'rb'))
+        # materialize the vocabulary once: membership tests against
+        # dict.values() rebuild the view and scan it linearly per word
+        vocabulary = set(self.vocab.values())
         for emb in embs:
             line = emb.split()
             word = line[0]
-            if word in self.vocab.values():
-                vect = np.array(line[1:]).astype(float)
-                vectors[word] = vect
+            if word in vocabulary:
+                vectors[word] = np.asarray(line[1:], dtype=float)
         return vectors
 
     def filter_pretrained_embeddings(